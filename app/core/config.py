@@ -19,6 +19,8 @@ class Settings(BaseSettings):
     # --- 核心安全与部署配置 ---
     API_MASTER_KEY: Optional[str] = "1"
     NGINX_PORT: int = 8088
+    # 日志级别，设为 DEBUG 时会额外输出完整请求包与上游原始 SSE 数据
+    LOG_LEVEL: str = "INFO"
     
     # --- Doubao 凭证 ---
     DOUBAO_COOKIES: List[str] = []
@@ -33,6 +35,12 @@ class Settings(BaseSettings):
 
     # --- 上游 API 配置 ---
     API_REQUEST_TIMEOUT: int = 180
+
+    # --- Playwright 签名服务 ---
+    # 预热的签名页面数量，决定可并行执行的 a_bogus 签名请求数
+    PLAYWRIGHT_POOL_SIZE: int = 2
+    # 已签名 URL 的缓存时间（秒），突发请求可直接复用签名
+    SIGNATURE_CACHE_TTL: int = 30
     
     # --- 会话管理 ---
     SESSION_CACHE_TTL: int = 3600
@@ -45,34 +53,25 @@ class Settings(BaseSettings):
 
     @model_validator(mode='after')
     def validate_settings(self) -> 'Settings':
-        # 从环境变量 DOUBAO_COOKIE_1, DOUBAO_COOKIE_2, ... 加载 cookies
-        i = 1
-        while True:
-            cookie_str = os.getenv(f"DOUBAO_COOKIE_{i}")
-            if cookie_str:
-                self.DOUBAO_COOKIES.append(cookie_str)
-                i += 1
-            else:
-                break
+        env = os.environ
+
+        # 从环境变量 DOUBAO_COOKIE_1, DOUBAO_COOKIE_2, ... 加载 cookies (单次扫描 os.environ，按编号排序)
+        cookies_by_index: Dict[int, str] = {}
+        for key, value in env.items():
+            if key.startswith("DOUBAO_COOKIE_") and value:
+                suffix = key[len("DOUBAO_COOKIE_"):]
+                if suffix.isdigit():
+                    cookies_by_index[int(suffix)] = value
+        self.DOUBAO_COOKIES.extend(cookies_by_index[i] for i in sorted(cookies_by_index))
         
         if not self.DOUBAO_COOKIES:
             raise ValueError("必须至少配置一个有效的 DOUBAO_COOKIE 环境变量 (例如 DOUBAO_COOKIE_1)")
 
         # --- 核心变更: 优先从环境变量读取设备指纹 ---
         # 如果环境变量中有值，则使用环境变量的值覆盖 .env 文件中的值
-        device_id_from_env = os.getenv("DOUBAO_DEVICE_ID")
-        fp_from_env = os.getenv("DOUBAO_FP")
-        tea_uuid_from_env = os.getenv("DOUBAO_TEA_UUID")
-        web_id_from_env = os.getenv("DOUBAO_WEB_ID")
-        
-        if device_id_from_env:
-            self.DOUBAO_DEVICE_ID = device_id_from_env
-        if fp_from_env:
-            self.DOUBAO_FP = fp_from_env
-        if tea_uuid_from_env:
-            self.DOUBAO_TEA_UUID = tea_uuid_from_env
-        if web_id_from_env:
-            self.DOUBAO_WEB_ID = web_id_from_env
+        for attr in ("DOUBAO_DEVICE_ID", "DOUBAO_FP", "DOUBAO_TEA_UUID", "DOUBAO_WEB_ID"):
+            if value := env.get(attr):
+                setattr(self, attr, value)
 
         # --- 验证设备指纹是否已配置 ---
         if not all([self.DOUBAO_DEVICE_ID, self.DOUBAO_FP, self.DOUBAO_TEA_UUID, self.DOUBAO_WEB_ID]):
@@ -1,13 +1,18 @@
 # /app/providers/doubao_provider.py
-import json
+import asyncio
+import os
 import re
+import sys
 import time
 import uuid
-from typing import Dict, Any, AsyncGenerator, List
+from contextlib import aclosing
+from typing import Dict, Any, AsyncGenerator, List, Optional, Tuple
 
 import httpx
+import orjson
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
+from httpx_sse import EventSource
 from loguru import logger
 
 from app.core.config import settings
@@ -17,22 +22,179 @@ from app.services.playwright_manager import PlaywrightManager
 from app.services.session_manager import SessionManager
 from app.utils.sse_utils import create_sse_data, create_chat_completion_chunk, DONE_CHUNK
 
+# 模型配置在进程内不变，绑定为模块级常量，省去每次请求的 settings 属性查找
+_DEFAULT_MODEL = settings.DEFAULT_MODEL
+_MODEL_MAPPING = settings.MODEL_MAPPING
+
+# 上游 SSE 事件在读取任务与解析循环之间的缓冲深度
+_SSE_QUEUE_SIZE = 64
+
+_MS_TOKEN_RE = re.compile(r'msToken=([^;]+)')
+
+_COMPLETION_URL = "https://www.doubao.com/samantha/chat/completion"
+
+# 除 Cookie 外全部固定不变的请求头，作为共享 httpx 客户端的默认请求头
+_STATIC_HEADERS: Dict[str, str] = {
+    "Accept": "*/*", "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "Content-Type": "application/json",
+    "Origin": "https://www.doubao.com", "Referer": "https://www.doubao.com/chat/",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36",
+    "agw-js-conv": "str, str",
+    "sec-ch-ua": '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";v="141"',
+    "sec-ch-ua-mobile": "?0", "sec-ch-ua-platform": '"Windows"',
+    "sec-fetch-dest": "empty", "sec-fetch-mode": "cors", "sec-fetch-site": "same-origin",
+}
+
+# 预热连接时发出的是直接打开首页的文档请求: 去掉仅用于 API 调用的请求头 (及 Referer)，并替换为导航请求的取值
+_PREWARM_DROP_HEADERS = ("Content-Type", "Origin", "Referer", "agw-js-conv")
+_DOCUMENT_HEADERS: Dict[str, str] = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "sec-fetch-dest": "document", "sec-fetch-mode": "navigate", "sec-fetch-site": "none",
+}
+
+# 签名前的基础查询参数 (只读，get_signed_url 内部会先 copy 再合并动态参数)
+_BASE_PARAMS: Dict[str, str] = {
+    "aid": "497858", "device_platform": "web", "language": "zh",
+    "pc_version": "2.41.0", "pkg_type": "release_version", "real_aid": "497858",
+    "region": "CN", "samantha_web": "1", "sys_region": "CN",
+    "use-olympus-account": "1", "version_code": "20800",
+}
+
+# 流式内容回显到终端时，每累计这么多个数据块才写一次 stdout
+_ECHO_FLUSH_CHUNKS = 16
+
+
+def _flush_echo(buffer: List[str]):
+    if buffer:
+        sys.stdout.write("".join(buffer))
+        sys.stdout.flush()
+        buffer.clear()
+
+
+def _new_uuids(count: int) -> List[uuid.UUID]:
+    """
+    一次读取 count * 16 字节随机数并切分为多个 UUID4，代替多次 uuid.uuid4() 各自调用 os.urandom。
+    """
+    rand = os.urandom(16 * count)
+    return [uuid.UUID(bytes=rand[i:i + 16], version=4) for i in range(0, 16 * count, 16)]
+
+
+async def _aiter_sse_data(response: httpx.Response) -> AsyncGenerator[str, None]:
+    """
+    由后台任务读取上游 SSE 事件并写入有界队列，调用方同时解析上一个事件，
+    使网络接收与 JSON 解析重叠进行。读取过程中的异常会在调用方重新抛出。
+    若上游返回的不是 SSE 响应 (常见于反爬虫拦截)，不产出任何数据，交由调用方的"未返回数据流"分支处理。
+    """
+    content_type = response.headers.get("content-type", "")
+    if "text/event-stream" not in content_type:
+        body = await response.aread()
+        logger.warning(
+            f"上游响应不是 SSE 数据流 (Content-Type: {content_type!r})，"
+            f"响应内容: {body[:500].decode(errors='ignore')}"
+        )
+        return
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_SSE_QUEUE_SIZE)
+
+    async def _reader():
+        try:
+            # httpx-sse 负责 data: 前缀剥离、多行 data 合并与注释行过滤，每个事件只解码一次
+            async for event in EventSource(response).aiter_sse():
+                await queue.put(event.data)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+
+    reader = asyncio.create_task(_reader())
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+
+
+# 载荷模板中变量字段的占位符 (序列化后带引号)，用于切分模板
+_PAYLOAD_PLACEHOLDER_RE = re.compile(rb'"@@[a-z_]+@@"')
+
+
+def _compile_payload_template(is_new_conversation: bool) -> List[bytes]:
+    """
+    预先序列化请求载荷中固定不变的部分，返回以变量字段占位符切分后的字节片段。
+    """
+    payload = {
+        "messages": [{"content": "@@content@@", "content_type": 2001, "attachments": [], "references": []}],
+        "completion_option": {
+            "is_regen": False, "with_suggest": True, "need_create_conversation": is_new_conversation,
+            "launch_stage": 1, "is_replace": False, "is_delete": False, "message_from": 0,
+            "action_bar_skill_id": 0, "use_deep_think": False, "use_auto_cot": True,
+            "resend_for_regen": False, "enable_commerce_credit": False, "event_id": "0"
+        },
+        "evaluate_option": {"web_ab_params": ""},
+        "conversation_id": "@@conversation_id@@",
+        "local_conversation_id": "@@local_conversation_id@@",
+        "local_message_id": "@@local_message_id@@"
+    }
+    if not is_new_conversation:
+        payload["bot_id"] = "@@bot_id@@"
+    return _PAYLOAD_PLACEHOLDER_RE.split(orjson.dumps(payload))
+
+
+# 按是否新建会话区分的两份载荷模板 (新会话需创建会话且不携带 bot_id)
+_PAYLOAD_TEMPLATES: Dict[bool, List[bytes]] = {
+    True: _compile_payload_template(True),
+    False: _compile_payload_template(False),
+}
+
 
 class DoubaoProvider(BaseProvider):
     def __init__(self):
         self.credential_manager = CredentialManager(settings.DOUBAO_COOKIES)
         self.session_manager = SessionManager()
-        self.playwright_manager = PlaywrightManager()
+        self.playwright_manager: Optional[PlaywrightManager] = None
         self.client: httpx.AsyncClient = None
+        # base_cookie -> (msToken, 替换后的 Cookie)，msToken 未变化时直接复用
+        self._dynamic_cookie_cache: Dict[str, Tuple[str, str]] = {}
 
     async def initialize(self):
-        self.client = httpx.AsyncClient(timeout=settings.API_REQUEST_TIMEOUT)
-        await self.playwright_manager.initialize(self.credential_manager.credentials)
+        # HTTP/2 复用同一条 TCP+TLS 连接承载并发的 SSE 流，固定请求头直接挂在客户端上
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(settings.API_REQUEST_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=500, keepalive_expiry=60.0),
+            headers=_STATIC_HEADERS,
+        )
+        self.playwright_manager = await PlaywrightManager.get(self.credential_manager.parsed[0])
+        # Playwright 页面池预热耗时较长，放在其后预热 HTTP 连接，避免连接在首个请求前因空闲被回收
+        await self._prewarm_connection()
 
     async def close(self):
         if self.client:
             await self.client.aclose()
-        await self.playwright_manager.close()
+        if self.playwright_manager:
+            await self.playwright_manager.close()
+
+    async def _prewarm_connection(self):
+        """
+        预先与上游建立 TLS 会话，避免首个真实请求承担握手开销。
+        这是一次页面文档请求，因此去掉客户端上只属于 API 请求的请求头，并改用导航请求的 Accept 与 sec-fetch 头。
+        """
+        request = self.client.build_request("GET", "https://www.doubao.com/")
+        for name in _PREWARM_DROP_HEADERS:
+            request.headers.pop(name, None)
+        request.headers.update(_DOCUMENT_HEADERS)
+        try:
+            await self.client.send(request)
+            logger.info("已预热到豆包上游的 HTTP 连接。")
+        except httpx.HTTPError as e:
+            logger.warning(f"预热上游 HTTP 连接失败，将在首次请求时再建立连接: {e}")
 
     def _get_dynamic_cookie(self, base_cookie: str) -> str:
         """
@@ -44,13 +206,21 @@ class DoubaoProvider(BaseProvider):
             logger.warning("动态 Cookie 更新失败：Playwright 管理器中没有可用的 msToken。将使用原始 Cookie。")
             return base_cookie
 
-        if 'msToken=' in base_cookie:
-            new_cookie = re.sub(r'msToken=[^;]+', f'msToken={latest_ms_token}', base_cookie)
+        cached = self._dynamic_cookie_cache.get(base_cookie)
+        if cached and cached[0] == latest_ms_token:
+            return cached[1]
+
+        match = _MS_TOKEN_RE.search(base_cookie)
+        if match and match.group(1) == latest_ms_token:
+            new_cookie = base_cookie
+        elif match:
+            new_cookie = _MS_TOKEN_RE.sub(f'msToken={latest_ms_token}', base_cookie, count=1)
             logger.info("成功将动态 msToken 更新到 Cookie 头中。")
         else:
             new_cookie = f"{base_cookie.strip(';')}; msToken={latest_ms_token}"
             logger.info("原始 Cookie 中未找到 msToken，已追加最新的 msToken。")
         
+        self._dynamic_cookie_cache[base_cookie] = (latest_ms_token, new_cookie)
         return new_cookie
 
     async def chat_completion(self, request_data: Dict[str, Any]):
@@ -68,11 +238,12 @@ class DoubaoProvider(BaseProvider):
         """
         处理非流式聊天补全请求。
         """
-        session_id = request_data.get("user", f"session-{uuid.uuid4().hex}")
-        messages = request_data.get("messages", [])
-        user_model = request_data.get("model", settings.DEFAULT_MODEL)
+        request_uuid, session_uuid, local_conversation_uuid, local_message_uuid = _new_uuids(4)
+        session_id = request_data.get("user") or f"session-{session_uuid.hex}"
+        messages = request_data.get("messages") or ()
+        user_model = request_data.get("model") or _DEFAULT_MODEL
 
-        bot_id = settings.MODEL_MAPPING.get(user_model)
+        bot_id = _MODEL_MAPPING.get(user_model)
         if not bot_id:
             raise HTTPException(status_code=400, detail=f"不支持的模型: {user_model}")
 
@@ -80,7 +251,7 @@ class DoubaoProvider(BaseProvider):
         conversation_id = session_data.get("conversation_id", "0")
         is_new_conversation = conversation_id == "0"
 
-        request_id = f"chatcmpl-{uuid.uuid4()}"
+        request_id = f"chatcmpl-{request_uuid}"
         new_conversation_id = None
         full_content = []
         streamed_any_data = False
@@ -88,35 +259,25 @@ class DoubaoProvider(BaseProvider):
         try:
             base_cookie = self.credential_manager.get_credential()
             final_cookie = self._get_dynamic_cookie(base_cookie)
-            base_url = "https://www.doubao.com/samantha/chat/completion"
-            base_params = {
-                "aid": "497858", "device_platform": "web", "language": "zh",
-                "pc_version": "2.41.0", "pkg_type": "release_version", "real_aid": "497858",
-                "region": "CN", "samantha_web": "1", "sys_region": "CN",
-                "use-olympus-account": "1", "version_code": "20800",
-            }
             headers = self._prepare_headers(final_cookie)
-            payload = self._prepare_payload(messages, bot_id, conversation_id)
-
-            log_headers = headers.copy()
-            log_headers["Cookie"] = "[REDACTED FOR SECURITY]"
-            logger.info("--- 准备向上游发送的完整请求包 (非流式) ---")
-            logger.info(f"请求方法: POST")
-            logger.info(f"基础URL: {base_url}")
-            logger.info(f"请求头 (Headers):\n{json.dumps(log_headers, indent=2)}")
-            logger.info(f"请求载荷 (Payload):\n{json.dumps(payload, indent=2, ensure_ascii=False)}")
-            logger.info("------------------------------------")
-
-            signed_url = await self.playwright_manager.get_signed_url(base_url, final_cookie, base_params)
+            payload = self._prepare_payload(
+                messages, bot_id, conversation_id,
+                f"local_{local_conversation_uuid.hex}", str(local_message_uuid)
+            )
+
+            self._log_upstream_request("非流式", headers, payload)
+
+            playwright_manager = self.playwright_manager
+            signed_url = await playwright_manager.get_signed_url(_COMPLETION_URL, final_cookie, _BASE_PARAMS)
             if not signed_url:
                 raise Exception("无法获取 a_bogus 签名, Playwright 服务可能异常。")
 
             logger.info(f"签名成功，最终请求 URL: {signed_url}")
 
-            async with self.client.stream("POST", signed_url, headers=headers, json=payload) as response:
+            async with self.client.stream("POST", signed_url, headers=headers, content=payload) as response:
                 new_ms_token = response.headers.get("x-ms-token")
-                if new_ms_token:
-                    self.playwright_manager.update_ms_token(new_ms_token)
+                if new_ms_token and new_ms_token != playwright_manager.ms_token:
+                    playwright_manager.ms_token = new_ms_token
                     logger.success(f"从响应头中捕获并更新了 msToken: {new_ms_token}")
 
                 if response.status_code != 200:
@@ -127,33 +288,35 @@ class DoubaoProvider(BaseProvider):
 
                 logger.success(f"成功连接到上游服务器, 状态码: {response.status_code}. 开始接收响应...")
 
-                async for line in response.aiter_lines():
-                    # [诊断日志] 打印从上游收到的每一行原始数据
-                    logger.info(f"上游原始响应行: {line}")
-                    streamed_any_data = True
-                    if not line.startswith("data:"):
-                        continue
-                    content_str = line[len("data:"):].strip()
-                    if not content_str:
-                        continue
-
-                    try:
-                        data = json.loads(content_str)
-                        if data.get("event_type") == 2002 and not new_conversation_id:
-                            event_data = json.loads(data.get("event_data", "{}"))
-                            new_conversation_id = event_data.get("conversation_id")
-                            logger.info(f"捕获到新会话 ID: {new_conversation_id}")
-
-                        if data.get("event_type") == 2001:
-                            event_data = json.loads(data.get("event_data", "{}"))
-                            message_data = event_data.get("message", {})
-                            content_json = json.loads(message_data.get("content", "{}"))
-                            delta_content = content_json.get("text", "")
-                            if delta_content:
-                                full_content.append(delta_content)
-                    except (json.JSONDecodeError, KeyError) as e:
-                        logger.warning(f"解析 SSE 数据块时跳过: {e}, 内容: {content_str}")
-                        continue
+                append_content = full_content.append
+                log_info = logger.info
+                log_debug = logger.opt(lazy=True).debug
+                async with aclosing(_aiter_sse_data(response)) as sse_data:
+                    async for content_str in sse_data:
+                        # [诊断日志] 仅在 DEBUG 级别启用时才格式化上游原始事件数据
+                        log_debug("上游原始 SSE 事件: {}", lambda: content_str)
+                        streamed_any_data = True
+                        if not content_str:
+                            continue
+
+                        try:
+                            data = orjson.loads(content_str)
+                            et = data.get("event_type")
+                            if et == 2002 and not new_conversation_id:
+                                event_data = orjson.loads(data.get("event_data", "{}"))
+                                new_conversation_id = event_data.get("conversation_id")
+                                log_info(f"捕获到新会话 ID: {new_conversation_id}")
+
+                            if et == 2001:
+                                event_data = orjson.loads(data.get("event_data", "{}"))
+                                message_data = event_data.get("message", {})
+                                content_json = orjson.loads(message_data.get("content", "{}"))
+                                delta_content = content_json.get("text", "")
+                                if delta_content:
+                                    append_content(delta_content)
+                        except (orjson.JSONDecodeError, KeyError) as e:
+                            logger.warning(f"解析 SSE 数据块时跳过: {e}, 内容: {content_str}")
+                            continue
 
             if not streamed_any_data:
                 logger.error("上游服务器返回了 200 OK，但没有发送任何数据流。这通常是由于反爬虫策略触发。")
@@ -195,14 +358,15 @@ class DoubaoProvider(BaseProvider):
         """
         处理流式聊天补全请求。
         """
-        session_id = request_data.get("user", f"session-{uuid.uuid4().hex}")
-        messages = request_data.get("messages", [])
-        user_model = request_data.get("model", settings.DEFAULT_MODEL)
+        request_uuid, session_uuid, local_conversation_uuid, local_message_uuid = _new_uuids(4)
+        session_id = request_data.get("user") or f"session-{session_uuid.hex}"
+        messages = request_data.get("messages") or ()
+        user_model = request_data.get("model") or _DEFAULT_MODEL
 
-        bot_id = settings.MODEL_MAPPING.get(user_model)
+        bot_id = _MODEL_MAPPING.get(user_model)
         if not bot_id:
             # This should be handled before calling the generator, but as a safeguard:
-            error_chunk = create_chat_completion_chunk(f"chatcmpl-{uuid.uuid4()}", user_model, f"不支持的模型: {user_model}", "stop")
+            error_chunk = create_chat_completion_chunk(f"chatcmpl-{request_uuid}", user_model, f"不支持的模型: {user_model}", "stop")
             yield create_sse_data(error_chunk)
             yield DONE_CHUNK
             return
@@ -211,33 +375,24 @@ class DoubaoProvider(BaseProvider):
         conversation_id = session_data.get("conversation_id", "0")
         is_new_conversation = conversation_id == "0"
 
-        request_id = f"chatcmpl-{uuid.uuid4()}"
+        request_id = f"chatcmpl-{request_uuid}"
         new_conversation_id = None
         streamed_any_data = False
+        echo_buffer: List[str] = []
 
         try:
             base_cookie = self.credential_manager.get_credential()
             final_cookie = self._get_dynamic_cookie(base_cookie)
-            base_url = "https://www.doubao.com/samantha/chat/completion"
-            base_params = {
-                "aid": "497858", "device_platform": "web", "language": "zh",
-                "pc_version": "2.41.0", "pkg_type": "release_version", "real_aid": "497858",
-                "region": "CN", "samantha_web": "1", "sys_region": "CN",
-                "use-olympus-account": "1", "version_code": "20800",
-            }
             headers = self._prepare_headers(final_cookie)
-            payload = self._prepare_payload(messages, bot_id, conversation_id)
-
-            log_headers = headers.copy()
-            log_headers["Cookie"] = "[REDACTED FOR SECURITY]"
-            logger.info("--- 准备向上游发送的完整请求包 (流式) ---")
-            logger.info(f"请求方法: POST")
-            logger.info(f"基础URL: {base_url}")
-            logger.info(f"请求头 (Headers):\n{json.dumps(log_headers, indent=2)}")
-            logger.info(f"请求载荷 (Payload):\n{json.dumps(payload, indent=2, ensure_ascii=False)}")
-            logger.info("------------------------------------")
-
-            signed_url = await self.playwright_manager.get_signed_url(base_url, final_cookie, base_params)
+            payload = self._prepare_payload(
+                messages, bot_id, conversation_id,
+                f"local_{local_conversation_uuid.hex}", str(local_message_uuid)
+            )
+
+            self._log_upstream_request("流式", headers, payload)
+
+            playwright_manager = self.playwright_manager
+            signed_url = await playwright_manager.get_signed_url(_COMPLETION_URL, final_cookie, _BASE_PARAMS)
             if not signed_url:
                 raise Exception("无法获取 a_bogus 签名, Playwright 服务可能异常。")
 
@@ -246,10 +401,10 @@ class DoubaoProvider(BaseProvider):
             # 按照用户要求，在流式输出前打印一个标识
             print("\n--- [流式] 响应内容 ---")
 
-            async with self.client.stream("POST", signed_url, headers=headers, json=payload) as response:
+            async with self.client.stream("POST", signed_url, headers=headers, content=payload) as response:
                 new_ms_token = response.headers.get("x-ms-token")
-                if new_ms_token:
-                    self.playwright_manager.update_ms_token(new_ms_token)
+                if new_ms_token and new_ms_token != playwright_manager.ms_token:
+                    playwright_manager.ms_token = new_ms_token
                     logger.success(f"从响应头中捕获并更新了 msToken: {new_ms_token}")
 
                 if response.status_code != 200:
@@ -260,38 +415,43 @@ class DoubaoProvider(BaseProvider):
 
                 logger.success(f"成功连接到上游服务器, 状态码: {response.status_code}. 开始接收响应...")
 
-                async for line in response.aiter_lines():
-                    # [诊断日志] 打印从上游收到的每一行原始数据
-                    logger.info(f"上游原始响应行: {line}")
-                    streamed_any_data = True
-                    if not line.startswith("data:"):
-                        continue
-                    content_str = line[len("data:"):].strip()
-                    if not content_str:
-                        continue
-
-                    try:
-                        data = json.loads(content_str)
-                        if data.get("event_type") == 2002 and not new_conversation_id:
-                            event_data = json.loads(data.get("event_data", "{}"))
-                            new_conversation_id = event_data.get("conversation_id")
-                            logger.info(f"捕获到新会话 ID: {new_conversation_id}")
-
-                        if data.get("event_type") == 2001:
-                            event_data = json.loads(data.get("event_data", "{}"))
-                            message_data = event_data.get("message", {})
-                            content_json = json.loads(message_data.get("content", "{}"))
-                            delta_content = content_json.get("text", "")
-                            if delta_content:
-                                # 按照用户要求，将流式数据块直接打印到终端
-                                print(delta_content, end="", flush=True)
-                                chunk = create_chat_completion_chunk(request_id, user_model, delta_content)
-                                yield create_sse_data(chunk)
-                    except (json.JSONDecodeError, KeyError) as e:
-                        logger.warning(f"解析 SSE 数据块时跳过: {e}, 内容: {content_str}")
-                        continue
+                log_info = logger.info
+                log_debug = logger.opt(lazy=True).debug
+                echo = echo_buffer.append
+                async with aclosing(_aiter_sse_data(response)) as sse_data:
+                    async for content_str in sse_data:
+                        # [诊断日志] 仅在 DEBUG 级别启用时才格式化上游原始事件数据
+                        log_debug("上游原始 SSE 事件: {}", lambda: content_str)
+                        streamed_any_data = True
+                        if not content_str:
+                            continue
+
+                        try:
+                            data = orjson.loads(content_str)
+                            et = data.get("event_type")
+                            if et == 2002 and not new_conversation_id:
+                                event_data = orjson.loads(data.get("event_data", "{}"))
+                                new_conversation_id = event_data.get("conversation_id")
+                                log_info(f"捕获到新会话 ID: {new_conversation_id}")
+
+                            if et == 2001:
+                                event_data = orjson.loads(data.get("event_data", "{}"))
+                                message_data = event_data.get("message", {})
+                                content_json = orjson.loads(message_data.get("content", "{}"))
+                                delta_content = content_json.get("text", "")
+                                if delta_content:
+                                    # 按照用户要求，将流式数据块打印到终端 (攒批写入，避免每个 token 一次系统调用)
+                                    echo(delta_content)
+                                    if len(echo_buffer) >= _ECHO_FLUSH_CHUNKS:
+                                        _flush_echo(echo_buffer)
+                                    chunk = create_chat_completion_chunk(request_id, user_model, delta_content)
+                                    yield create_sse_data(chunk)
+                        except (orjson.JSONDecodeError, KeyError) as e:
+                            logger.warning(f"解析 SSE 数据块时跳过: {e}, 内容: {content_str}")
+                            continue
             
             # 在流式输出结束后打印换行符和结束标识
+            _flush_echo(echo_buffer)
             if streamed_any_data:
                 print("\n--------------------------\n")
 
@@ -314,49 +474,54 @@ class DoubaoProvider(BaseProvider):
         except Exception as e:
             logger.error(f"处理流时发生严重错误: {e}", exc_info=True)
             # 在流式输出结束后打印换行符和结束标识
+            _flush_echo(echo_buffer)
             print("\n--- [流式] 发生错误 ---\n")
             error_chunk = create_chat_completion_chunk(request_id, user_model, f"内部服务器错误: {str(e)}", "stop")
             yield create_sse_data(error_chunk)
             yield DONE_CHUNK
 
+    def _log_upstream_request(self, mode: str, headers: Dict[str, str], payload: bytes):
+        logger.info(f"准备向上游发送请求 ({mode}): POST {_COMPLETION_URL}")
+        # 完整请求头与载荷只在 DEBUG 级别启用时才序列化，脱敏后的请求头也只在此时构造
+        log_debug = logger.opt(lazy=True).debug
+        log_debug(
+            "请求头 (Headers):\n{}",
+            lambda: orjson.dumps({**_STATIC_HEADERS, **headers, "Cookie": "[REDACTED FOR SECURITY]"}, option=orjson.OPT_INDENT_2).decode()
+        )
+        log_debug("请求载荷 (Payload):\n{}", lambda: orjson.dumps(orjson.loads(payload), option=orjson.OPT_INDENT_2).decode())
+
     def _prepare_headers(self, cookie: str) -> Dict[str, str]:
-        return {
-            "Accept": "*/*", "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-            "Content-Type": "application/json", "Cookie": cookie,
-            "Origin": "https://www.doubao.com", "Referer": "https://www.doubao.com/chat/",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36",
-            "agw-js-conv": "str, str",
-            "sec-ch-ua": '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";v="141"',
-            "sec-ch-ua-mobile": "?0", "sec-ch-ua-platform": '"Windows"',
-            "sec-fetch-dest": "empty", "sec-fetch-mode": "cors", "sec-fetch-site": "same-origin",
-        }
-
-    def _prepare_payload(self, messages: List[Dict[str, Any]], bot_id: str, conversation_id: str) -> Dict[str, Any]:
+        # 固定请求头已设置在共享客户端上，这里只需提供按请求变化的 Cookie
+        return {"Cookie": cookie}
+
+    def _prepare_payload(
+        self, messages: List[Dict[str, Any]], bot_id: str, conversation_id: str,
+        local_conversation_id: str, local_message_id: str
+    ) -> bytes:
         last_user_message = next((m for m in reversed(messages) if m.get("role") == "user"), None)
         if not last_user_message:
             raise HTTPException(status_code=400, detail="未找到用户消息。")
 
-        payload = {
-            "messages": [{"content": json.dumps({"text": last_user_message["content"]}), "content_type": 2001, "attachments": [], "references": []}],
-            "completion_option": {
-                "is_regen": False, "with_suggest": True, "need_create_conversation": conversation_id == "0",
-                "launch_stage": 1, "is_replace": False, "is_delete": False, "message_from": 0,
-                "action_bar_skill_id": 0, "use_deep_think": False, "use_auto_cot": True,
-                "resend_for_regen": False, "enable_commerce_credit": False, "event_id": "0"
-            },
-            "evaluate_option": {"web_ab_params": ""},
-            "conversation_id": conversation_id,
-            "local_conversation_id": f"local_{uuid.uuid4().hex}",
-            "local_message_id": str(uuid.uuid4())
-        }
-
-        if conversation_id != "0":
-            payload["bot_id"] = bot_id
-        
-        return payload
+        is_new_conversation = conversation_id == "0"
+        # 变量字段按模板中占位符的顺序依次拼接
+        values = [
+            orjson.dumps(orjson.dumps({"text": last_user_message["content"]}).decode()),
+            orjson.dumps(conversation_id),
+            orjson.dumps(local_conversation_id),
+            orjson.dumps(local_message_id),
+        ]
+        if not is_new_conversation:
+            values.append(orjson.dumps(bot_id))
+
+        segments = _PAYLOAD_TEMPLATES[is_new_conversation]
+        parts = [segments[0]]
+        for value, segment in zip(values, segments[1:]):
+            parts.append(value)
+            parts.append(segment)
+        return b"".join(parts)
 
     async def get_models(self) -> JSONResponse:
         return JSONResponse(content={
             "object": "list",
-            "data": [{"id": name, "object": "model", "created": int(time.time()), "owned_by": "lzA6"} for name in settings.MODEL_MAPPING.keys()]
+            "data": [{"id": name, "object": "model", "created": int(time.time()), "owned_by": "lzA6"} for name in _MODEL_MAPPING.keys()]
         })
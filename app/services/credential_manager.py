@@ -1,6 +1,6 @@
 # /app/services/credential_manager.py
-import threading
-from typing import List
+import itertools
+from typing import Dict, List
 from loguru import logger
 
 class CredentialManager:
@@ -8,13 +8,19 @@ class CredentialManager:
         if not credentials:
             raise ValueError("凭证列表不能为空。")
         self.credentials = credentials
-        self.index = 0
-        self.lock = threading.Lock()
+        # itertools.cycle 的 next() 在 GIL 下是原子操作，无需额外加锁即可轮询
+        self._cycle = itertools.cycle(self.credentials)
+        # 预先把每个 Cookie 字符串解析成 Playwright 所需的 cookie 列表，只解析一次
+        self.parsed: List[List[Dict[str, str]]] = [self._parse_cookie(c) for c in self.credentials]
         logger.info(f"凭证管理器已初始化，共加载 {len(self.credentials)} 个凭证。")
 
     def get_credential(self) -> str:
-        with self.lock:
-            credential = self.credentials[self.index]
-            self.index = (self.index + 1) % len(self.credentials)
-            logger.debug(f"轮询到凭证索引: {self.index}")
-            return credential
+        return next(self._cycle)
+
+    @staticmethod
+    def _parse_cookie(cookie_str: str) -> List[Dict[str, str]]:
+        return [
+            {"name": name.strip(), "value": value.strip(), "domain": ".doubao.com", "path": "/"}
+            for name, sep, value in (part.partition('=') for part in cookie_str.split(';'))
+            if sep
+        ]
@@ -1,30 +1,39 @@
 # /app/services/playwright_manager.py
 import asyncio
+import heapq
 import json
+import re
 import uuid
-from typing import Optional, Dict, List
+from hashlib import blake2b
+from typing import Optional, Dict, List, Tuple
 from urllib.parse import urlencode, urlparse
 
+from cachetools import TTLCache
 from playwright_stealth import stealth_async
 from playwright.async_api import async_playwright, Browser, Page, ConsoleMessage, TimeoutError, Route, Request
 from loguru import logger
 
 from app.core.config import settings # 导入 settings
 
+# 签名函数以固定源码 + 参数的形式调用: V8 只需编译一次，查询串经 CDP 作为参数传递，无需拼接进 JS 源码
+_SIGN_JS = "(q) => window.byted_acrawler.frontierSign(q)"
+
+# 常见的、无害的浏览器控制台噪音，合并为单个正则一次扫描完成匹配
+_CONSOLE_NOISE_RE = re.compile("|".join(map(re.escape, (
+    "Failed to load resource",
+    "net::ERR_FAILED",
+    "WebSocket connection",
+    "Content Security Policy",
+    "Scripts may close only the windows that were opened by them",
+    "Ignoring too frequent calls to print()",
+))))
+
 def handle_console_message(msg: ConsoleMessage):
     """将浏览器控制台日志转发到 Loguru，并过滤已知噪音"""
     log_level = msg.type.upper()
     text = msg.text
     # 过滤掉常见的、无害的浏览器噪音
-    if "Failed to load resource" in text or "net::ERR_FAILED" in text:
-        return
-    if "WebSocket connection" in text:
-        return
-    if "Content Security Policy" in text:
-        return
-    if "Scripts may close only the windows that were opened by them" in text:
-        return
-    if "Ignoring too frequent calls to print()" in text:
+    if _CONSOLE_NOISE_RE.search(text):
         return
 
     log_message = f"[Browser Console] {text}"
@@ -36,152 +45,212 @@ def handle_console_message(msg: ConsoleMessage):
         pass
 
 class PlaywrightManager:
-    _instance = None
+    _instance: Optional["PlaywrightManager"] = None
     _lock = asyncio.Lock()
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(PlaywrightManager, cls).__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
-
-    async def initialize(self, cookies: List[str]):
-        if self._initialized:
-            return
-        async with self._lock:
-            if self._initialized:
-                return
-            logger.info("正在初始化 Playwright 管理器 (签名服务模式)...")
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=True,
-                args=["--no-sandbox", "--disable-setuid-sandbox"]
-            )
-            self.page = await self.browser.new_page()
-
-            await stealth_async(self.page)
-            self.page.on("console", handle_console_message)
-            await self.page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-
-            self.static_device_fingerprint = {
-                'device_id': settings.DOUBAO_DEVICE_ID,
-                'fp': settings.DOUBAO_FP,
-                'web_id': settings.DOUBAO_WEB_ID,
-                'tea_uuid': settings.DOUBAO_TEA_UUID
-            }
-            logger.success(f"已从配置中加载静态设备指纹: {self.static_device_fingerprint}")
-            
-            self.ms_token = None
+    def __init__(self):
+        self._initialized = False
+        self.playwright = None
+        self.browser: Optional[Browser] = None
+        self.ms_token: Optional[str] = None
 
-            async def _handle_response(response):
+    @classmethod
+    async def get(cls, cookie_list: List[Dict[str, str]]) -> "PlaywrightManager":
+        """
+        返回进程内共享的 PlaywrightManager，首次调用时创建并完成初始化，之后直接复用。
+        """
+        instance = cls._instance
+        if instance is not None and instance._initialized:
+            return instance
+        async with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            instance = cls._instance
+            if not instance._initialized:
                 try:
-                    if 'x-ms-token' in response.headers:
-                        token = response.headers['x-ms-token']
-                        if token != self.ms_token:
-                            self.ms_token = token
-                            logger.success(f"通过响应头捕获到新的 msToken: {self.ms_token}")
-                except Exception as e:
-                    logger.warning(f"处理响应时出错: {e} (URL: {response.url})")
-
-            self.page.on("response", _handle_response)
-
-            if not cookies:
-                raise ValueError("Playwright 初始化需要至少一个有效的 Cookie。")
-            
-            logger.info("正在为初始页面加载设置 Cookie...")
-            initial_cookie_str = cookies[0]
-            try:
-                cookie_list = [
-                    {"name": c.split('=')[0].strip(), "value": c.split('=', 1)[1].strip(), "domain": ".doubao.com", "path": "/"}
-                    for c in initial_cookie_str.split(';') if '=' in c
-                ]
-                await self.page.context.add_cookies(cookie_list)
-                logger.success("初始 Cookie 设置完成。")
-            except IndexError as e:
-                logger.error(f"解析 Cookie 时出错: '{initial_cookie_str}'. 请确保 Cookie 格式正确。错误: {e}")
-                raise ValueError("Cookie 格式无效，无法进行初始化。") from e
+                    await instance._initialize(cookie_list)
+                except BaseException:
+                    # 初始化中途失败时释放已启动的浏览器，避免下次 get() 再启动第二个实例
+                    await instance._teardown()
+                    cls._instance = None
+                    raise
+        return instance
 
-            try:
-                logger.info("正在导航到豆包官网以加载签名脚本 (超时时间: 60秒)...")
-                await self.page.goto(
-                    "https://www.doubao.com/chat/",
-                    wait_until="load",
-                    timeout=60000
-                )
-                logger.info("页面导航完成 (load 事件触发)。")
-            except TimeoutError as e:
-                logger.error(f"导航到豆包官网超时: {e}")
-                raise RuntimeError("无法访问豆包官网，初始化失败。") from e
+    async def _initialize(self, cookie_list: List[Dict[str, str]]):
+        logger.info("正在初始化 Playwright 管理器 (签名服务模式)...")
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(
+            headless=True,
+            args=["--no-sandbox", "--disable-setuid-sandbox"]
+        )
 
-            try:
-                logger.info("正在等待关键签名函数 (window.byted_acrawler.frontierSign) 加载 (超时时间: 30秒)...")
-                await self.page.wait_for_function(
-                    "() => typeof window.byted_acrawler?.frontierSign === 'function'",
-                    timeout=30000
-                )
-                logger.success("关键签名函数已在启动时成功加载！")
-            except TimeoutError:
-                logger.error("等待签名函数超时！这很可能是因为 Cookie 无效或已过期。")
-                raise RuntimeError("无法加载豆包签名函数，请检查并更新 Cookie。")
-            
+        self.static_device_fingerprint = {
+            'device_id': settings.DOUBAO_DEVICE_ID,
+            'fp': settings.DOUBAO_FP,
+            'web_id': settings.DOUBAO_WEB_ID,
+            'tea_uuid': settings.DOUBAO_TEA_UUID
+        }
+        logger.success(f"已从配置中加载静态设备指纹: {self.static_device_fingerprint}")
+        # 基础参数 + 静态指纹在进程内不变，预先排序一次，签名时只需归并动态参数
+        self._static_params_source: Optional[Dict[str, str]] = None
+        self._sorted_static_items: List[Tuple[str, str]] = []
+        
+        self.ms_token = None
+        # 签名结果缓存: 同一 Cookie + msToken + 参数组合在 TTL 内复用已签名的 URL
+        self._sig_cache = TTLCache(maxsize=1024, ttl=settings.SIGNATURE_CACHE_TTL)
+
+        if not cookie_list:
+            raise ValueError("Playwright 初始化需要至少一个有效的 Cookie。")
+
+        # --- 签名页面池: 每个页面拥有独立的上下文，并发预热，并发请求可并行签名 ---
+        pool_size = max(1, settings.PLAYWRIGHT_POOL_SIZE)
+        logger.info(f"正在并发预热 {pool_size} 个签名页面...")
+        results = await asyncio.gather(
+            *(self._create_signing_page(cookie_list) for _ in range(pool_size)),
+            return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            # 任一页面预热失败时关闭已创建成功的页面，避免残留的浏览器上下文
+            for page in results:
+                if not isinstance(page, BaseException):
+                    await page.context.close()
+            raise errors[0]
+        self._page_pool: asyncio.Queue[Page] = asyncio.Queue()
+        for page in results:
+            self._page_pool.put_nowait(page)
+        
+        if not self.ms_token:
+            logger.info("等待 msToken 出现，最长等待 10 秒...")
+            await asyncio.sleep(10)
             if not self.ms_token:
-                logger.info("等待 msToken 出现，最长等待 10 秒...")
-                await asyncio.sleep(10)
-                if not self.ms_token:
-                    logger.warning("在额外等待后，依然未能捕获到初始 msToken。后续请求将依赖响应头更新。")
+                logger.warning("在额外等待后，依然未能捕获到初始 msToken。后续请求将依赖响应头更新。")
 
-            logger.success("Playwright 管理器 (签名服务模式) 初始化完成。")
-            self._initialized = True
+        logger.success(f"Playwright 管理器 (签名服务模式) 初始化完成，签名页面池大小: {pool_size}。")
+        self._initialized = True
+
+    async def _create_signing_page(self, cookie_list: List[Dict[str, str]]) -> Page:
+        page = await self.browser.new_page()
+
+        await stealth_async(page)
+        page.on("console", handle_console_message)
+        await page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+        async def _handle_response(response):
+            try:
+                if 'x-ms-token' in response.headers:
+                    token = response.headers['x-ms-token']
+                    if token != self.ms_token:
+                        self.ms_token = token
+                        logger.success(f"通过响应头捕获到新的 msToken: {self.ms_token}")
+            except Exception as e:
+                logger.warning(f"处理响应时出错: {e} (URL: {response.url})")
 
-    def update_ms_token(self, token: str):
-        self.ms_token = token
+        page.on("response", _handle_response)
+
+        await page.context.add_cookies(cookie_list)
+        logger.success("初始 Cookie 设置完成。")
+
+        try:
+            logger.info("正在导航到豆包官网以加载签名脚本 (超时时间: 60秒)...")
+            await page.goto(
+                "https://www.doubao.com/chat/",
+                wait_until="load",
+                timeout=60000
+            )
+            logger.info("页面导航完成 (load 事件触发)。")
+        except TimeoutError as e:
+            logger.error(f"导航到豆包官网超时: {e}")
+            raise RuntimeError("无法访问豆包官网，初始化失败。") from e
+
+        try:
+            logger.info("正在等待关键签名函数 (window.byted_acrawler.frontierSign) 加载 (超时时间: 30秒)...")
+            await page.wait_for_function(
+                "() => typeof window.byted_acrawler?.frontierSign === 'function'",
+                timeout=30000
+            )
+            logger.success("关键签名函数已在启动时成功加载！")
+        except TimeoutError:
+            logger.error("等待签名函数超时！这很可能是因为 Cookie 无效或已过期。")
+            raise RuntimeError("无法加载豆包签名函数，请检查并更新 Cookie。")
+
+        return page
 
     async def get_signed_url(self, base_url: str, cookie: str, base_params: Dict[str, str]) -> Optional[str]:
-        async with self._lock:
-            if not self._initialized:
-                raise RuntimeError("PlaywrightManager 未初始化。")
+        if not self._initialized:
+            raise RuntimeError("PlaywrightManager 未初始化。")
+
+        ms_token = self.ms_token
+        if not ms_token:
+            logger.error("msToken 未被初始化，无法构建有效请求！")
+            return None
+        static_items = self._get_sorted_static_items(base_params)
+
+        # web_tab_id 每次都不同，因此缓存键只取决于其余参数，命中时复用整条已签名的 URL
+        stable_query_string = urlencode(list(heapq.merge(static_items, [('msToken', ms_token)])))
+        cache_key = blake2b(f"{cookie}\0{base_url}?{stable_query_string}".encode(), digest_size=16).hexdigest()
+        cached_url = self._sig_cache.get(cache_key)
+        if cached_url:
+            logger.info("命中 a_bogus 签名缓存，跳过 Playwright 签名。")
+            return cached_url
+
+        # 从页面池中借出一个预热好的页面，签名完成后归还，避免所有请求串行排队
+        page = await self._page_pool.get()
+        try:
+            logger.info("正在使用 Playwright 生成 a_bogus 签名...")
+
+            # --- 核心修复: 对参数进行字母排序，以生成正确的签名 ---
+            # 静态部分已预排序，这里只需按序归并两个动态参数 (msToken < web_tab_id)
+            dynamic_items = [('msToken', ms_token), ('web_tab_id', str(uuid.uuid4()))]
+            final_query_string = urlencode(list(heapq.merge(static_items, dynamic_items)))
+            url_with_params = f"{base_url}?{final_query_string}"
+
+            logger.info(f"正在使用静态指纹和排序后的参数调用 window.byted_acrawler.frontierSign: \"{final_query_string}\"")
+            signature_obj = await page.evaluate(_SIGN_JS, final_query_string)
             
-            try:
-                logger.info("正在使用 Playwright 生成 a_bogus 签名...")
-                
-                final_params = base_params.copy()
-                final_params.update(self.static_device_fingerprint)
+            if isinstance(signature_obj, dict) and ('a_bogus' in signature_obj or 'X-Bogus' in signature_obj):
+                bogus_value = signature_obj.get('a_bogus') or signature_obj.get('X-Bogus')
+                logger.success(f"成功解析签名对象，获取到 a_bogus: {bogus_value}")
                 
-                final_params['web_tab_id'] = str(uuid.uuid4())
-                if self.ms_token:
-                    final_params['msToken'] = self.ms_token
-                else:
-                    logger.error("msToken 未被初始化，无法构建有效请求！")
-                    return None
-
-                # --- 核心修复: 对参数进行字母排序，以生成正确的签名 ---
-                sorted_params = dict(sorted(final_params.items()))
-                final_query_string = urlencode(sorted_params)
-                url_with_params = f"{base_url}?{final_query_string}"
-
-                logger.info(f"正在使用静态指纹和排序后的参数调用 window.byted_acrawler.frontierSign: \"{final_query_string}\"")
-                signature_obj = await self.page.evaluate(f'window.byted_acrawler.frontierSign("{final_query_string}")')
-                
-                if isinstance(signature_obj, dict) and ('a_bogus' in signature_obj or 'X-Bogus' in signature_obj):
-                    bogus_value = signature_obj.get('a_bogus') or signature_obj.get('X-Bogus')
-                    logger.success(f"成功解析签名对象，获取到 a_bogus: {bogus_value}")
-                    
-                    signed_url = f"{url_with_params}&a_bogus={bogus_value}"
-                    return signed_url
-                else:
-                    logger.error(f"调用签名函数失败，返回值不是预期的字典格式或缺少 a_bogus: {signature_obj}")
-                    return None
-
-            except Exception as e:
-                logger.error(f"Playwright 签名时发生严重错误: {e}", exc_info=True)
+                signed_url = f"{url_with_params}&a_bogus={bogus_value}"
+                self._sig_cache[cache_key] = signed_url
+                return signed_url
+            else:
+                logger.error(f"调用签名函数失败，返回值不是预期的字典格式或缺少 a_bogus: {signature_obj}")
                 return None
 
+        except Exception as e:
+            logger.error(f"Playwright 签名时发生严重错误: {e}", exc_info=True)
+            return None
+        finally:
+            self._page_pool.put_nowait(page)
+
+    def _get_sorted_static_items(self, base_params: Dict[str, str]) -> List[Tuple[str, str]]:
+        if base_params is not self._static_params_source:
+            merged = {**base_params, **self.static_device_fingerprint}
+            self._sorted_static_items = sorted(merged.items())
+            self._static_params_source = base_params
+        return self._sorted_static_items
+
+    async def _teardown(self):
+        self._initialized = False
+        browser, self.browser = self.browser, None
+        playwright, self.playwright = self.playwright, None
+        try:
+            if browser:
+                await browser.close()
+        except Exception as e:
+            logger.warning(f"关闭浏览器时出错: {e}")
+        try:
+            if playwright:
+                await playwright.stop()
+        except Exception as e:
+            logger.warning(f"停止 Playwright 时出错: {e}")
+
     async def close(self):
-        if self._initialized:
+        if self.browser or self.playwright:
             async with self._lock:
-                if self.browser:
-                    await self.browser.close()
-                if self.playwright:
-                    await self.playwright.stop()
-                self._initialized = False
+                await self._teardown()
+                if PlaywrightManager._instance is self:
+                    PlaywrightManager._instance = None
                 logger.info("Playwright 管理器已关闭。")
@@ -1,12 +1,13 @@
 # /app/utils/sse_utils.py
-import json
 import time
 from typing import Dict, Any, Optional
 
+import orjson
+
 DONE_CHUNK = b"data: [DONE]\n\n"
 
 def create_sse_data(data: Dict[str, Any]) -> bytes:
-    return f"data: {json.dumps(data)}\n\n".encode('utf-8')
+    return b"data: " + orjson.dumps(data) + b"\n\n"
 
 def create_chat_completion_chunk(
     request_id: str,
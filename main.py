@@ -15,7 +15,7 @@ from app.providers.doubao_provider import DoubaoProvider
 logger.remove()
 logger.add(
     sys.stdout,
-    level="INFO",
+    level=settings.LOG_LEVEL,
     format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
            "<level>{level: <8}</level> | "
            "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
@@ -58,7 +58,10 @@ async def verify_api_key(authorization: Optional[str] = Header(None)):
 async def chat_completions(request: Request):
     try:
         request_data = await request.json()
-        logger.info(f"收到客户端请求 /v1/chat/completions:\n{json.dumps(request_data, indent=2, ensure_ascii=False)}")
+        logger.opt(lazy=True).debug(
+            "收到客户端请求 /v1/chat/completions:\n{}",
+            lambda: json.dumps(request_data, indent=2, ensure_ascii=False)
+        )
         return await provider.chat_completion(request_data)
     except Exception as e:
         logger.error(f"处理聊天请求时发生顶层错误: {e}", exc_info=True)